@@ -21,18 +21,28 @@ Author: Lukas Eisenberger (leisenberger@juniper.net)
 
 """
 
+from __future__ import annotations
+
+import re
 import sys
+import traceback
+import zipfile
+import functools
 import ipaddress
+import types
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Any, List, Tuple, Optional
-
-from openpyxl import load_workbook
+from typing import TYPE_CHECKING, Dict, Any, Iterator, List, Tuple, Optional
 
 # Add parent directory to path for mistClient/mistHelpers
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-import mistClient
-import mistHelpers
+# openpyxl, mistClient and mistHelpers (requests) are imported in create_fabric(),
+# so loading this module stays cheap
+if TYPE_CHECKING:
+    import mistClient  # for the mistClient.Mist annotations only
 
 # =============================================================================
 # CONFIG:
@@ -41,27 +51,197 @@ MIST_ORGID = "MIST-ORG-ID"
 MIST_TOKEN = "API-TOKEN"
 MIST_API_URL = "https://api.eu.mist.com"
 spreadsheetname = "evpn-mh.xlsx"
+# Max. parallel per-device API updates (step 3); 1 = sequential
+MIST_MAX_WORKERS = 8
+
+# Only these sheets are read; any other tabs in the workbook are ignored
+REQUIRED_SHEETS = ("FABRIC", "INTERFACES", "NETWORKS")
 
 
 # =============================================================================
 # ------------------------ helpers ------------------------
+# Per NETWORKS row: network name and parsed gateway interfaces (None if not set)
+NetworkGateways = namedtuple("NetworkGateways", ("name", "gw4", "gw6"))
+
+# A single "route@nexthop" token from the STATIC_ROUTESv4/v6 cells
+_ROUTE_RE = re.compile(r"([^@]+)@(.+)")
+
+# INTERFACES SPEED values -> Mist API speed (Mist API uses lowercase)
+_SPEEDS = {"10G": "10g", "25G": "25g", "50G": "50g", "100G": "100g", "200G": "200g", "AUTO": "auto"}
+_SPEED_RE = re.compile(r'(\d+)G?', re.IGNORECASE)
+# Port name with optional channelization suffix, e.g. et-0/0/0:2
+_BASE_PORT_RE = re.compile(r'^([^:]+)(?::\d+)?$')
+# MAC separators removed by _mac()
+_MAC_STRIP = str.maketrans("", "", ":-.")
+# Cell values that _b() treats as True
+_TRUE_SET = frozenset({"1", "true", "t", "y", "yes", "on"})
+
+# Static part of the ESI-LAG port usage pushed in steps 1 and 4; "networks" and the mutable
+# "storm_control" dict are added per payload, so the read-only template holds only immutable values
+_ESI_LAG_USAGE_TEMPLATE = types.MappingProxyType({
+    "mode": "trunk",
+    "disabled": False,
+    "port_network": None,
+    "voip_network": None,
+    "stp_edge": False,
+    "all_networks": False,
+    "port_auth": None,
+    "speed": "auto",
+    "duplex": "auto",
+    "mac_limit": "0",
+    "poe_disabled": True,
+    "enable_qos": False,
+    "mtu": "9200"
+})
+
+
 def _b(v):
     if isinstance(v, bool): return v
     if v is None: return False
-    s = str(v).strip().lower()
-    return s in ("1", "true", "t", "y", "yes", "on")
+    if isinstance(v, int): return v == 1  # same result as str(v) in _TRUE_SET
+    return str(v).strip().lower() in _TRUE_SET
 
 
 def _i(v, default=None):
-    try:
-        if v is None or v == "":
-            return default
-        return int(v)
-    except Exception:
+    if v is None or v == "":
+        return default
+    # openpyxl already returns numeric cells as int/float (bool is an int subclass)
+    if isinstance(v, (int, float)):
         try:
-            return int(float(v))
-        except Exception:
+            return int(v)
+        except (ValueError, OverflowError):  # nan / inf
             return default
+    s = str(v).strip()
+    if not s:
+        return default
+    if s.isdecimal() or (s[0] in "+-" and s[1:].isdecimal()):
+        return int(s)
+    # text such as "1500.0" or "1e3"
+    try:
+        return int(float(s))
+    except (ValueError, OverflowError):
+        return default
+
+
+def _mac(v) -> str:
+    """Normalize a MAC address to the Mist form: lowercase, no separators"""
+    return (v or "").translate(_MAC_STRIP).lower()
+
+
+def _header_index(header_row: Tuple[Any, ...], upper: bool = False) -> Dict[str, int]:
+    """Map header names (stripped, optionally upper-cased) to column indices; first occurrence wins"""
+    col: Dict[str, int] = {}
+    for i, h in enumerate(header_row):
+        if not h: continue
+        h = str(h).strip()
+        col.setdefault(h.upper() if upper else h, i)
+    return col
+
+
+def _cell(row: Tuple[Any, ...], idx: Optional[int]) -> Any:
+    """Value of column idx, None if the column is absent or the row is shorter"""
+    return row[idx] if idx is not None and idx < len(row) else None
+
+
+def _s(v) -> Optional[str]:
+    """Stripped cell text, None for empty cells"""
+    return str(v).strip() if v else None
+
+
+def _speed(v) -> Optional[str]:
+    """Normalize a SPEED cell (10G, 25G, 50G, 100G, 200G, AUTO; case-insensitive) to the Mist value"""
+    speed_raw = str(v).strip().upper()
+    speed = _SPEEDS.get(speed_raw)
+    if speed is None:
+        # Try to extract just the number+G part
+        match = _SPEED_RE.match(speed_raw)
+        if match:
+            speed = f"{match.group(1)}g"
+        else:
+            print(f"Warning: Unknown SPEED '{v}' ignored (expected 10G, 25G, 50G, 100G, 200G or AUTO)")
+    return speed
+
+
+def _workbook_part(z: zipfile.ZipFile) -> str:
+    """Zip member name of the workbook part, found like openpyxl does via _rels/.rels"""
+    try:
+        rels = ET.fromstring(z.read("_rels/.rels"))
+    except KeyError:
+        return "xl/workbook.xml"
+    for el in rels.iter():
+        if el.tag.rsplit("}", 1)[-1] == "Relationship" and (el.get("Type") or "").endswith("/officeDocument"):
+            return (el.get("Target") or "").lstrip("/")
+    return "xl/workbook.xml"
+
+
+def _check_required_sheets(xlsx_path: str) -> None:
+    """
+    Fail fast if the workbook lacks one of REQUIRED_SHEETS.
+    Only the workbook part is read from the xlsx (zip) container, no sheet is parsed.
+    """
+    try:
+        with zipfile.ZipFile(xlsx_path) as z:
+            part = _workbook_part(z)
+            if part not in z.namelist():
+                # unusual package layout: leave it to openpyxl and _get_sheet() to report
+                return
+            root = ET.fromstring(z.read(part))
+    except (OSError, zipfile.BadZipFile, ET.ParseError) as e:
+        raise Exception(f"Cannot read workbook '{xlsx_path}': {e}")
+    # <sheet name="..."/> elements; match on the local tag name (transitional and strict namespaces)
+    names = {el.get("name") for el in root.iter() if el.tag.rsplit("}", 1)[-1] == "sheet"}
+    missing = [n for n in REQUIRED_SHEETS if n not in names]
+    if missing:
+        raise Exception(f"Workbook '{xlsx_path}' is missing required sheet(s): {', '.join(missing)}")
+
+
+@functools.lru_cache(maxsize=2048)
+def _base_port(port_name: str) -> str:
+    """Extract base port name, removing channelization suffix (:0, :1, etc.)"""
+    if not port_name:
+        return port_name
+    match = _BASE_PORT_RE.match(port_name)
+    if match:
+        return match.group(1)
+    return port_name
+
+
+# Spreadsheet strings repeat (same gateway for both cores, same routes in several rows);
+# ipaddress objects are immutable, so parsed results can be shared
+@functools.lru_cache(maxsize=1024)
+def _ip_network(s: str):
+    return ipaddress.ip_network(s, strict=False)
+
+
+@functools.lru_cache(maxsize=1024)
+def _ip_interface(s: str):
+    return ipaddress.ip_interface(s)
+
+
+def _is_v4_cidr(s: str) -> bool:
+    """
+    Fast check for the common "a.b.c.d/len" (or bare "a.b.c.d") route form.
+    Only accepts what ipaddress.ip_network(strict=False) accepts as well; False just
+    means "not decided here" and the caller falls back to ipaddress.
+    """
+    addr, sep, plen = s.partition("/")
+    if sep and not (plen.isascii() and plen.isdigit() and int(plen) <= 32):
+        return False
+    octets = addr.split(".")
+    return len(octets) == 4 and all(
+        o.isascii() and o.isdigit() and len(o) <= 3 and (o == "0" or o[0] != "0") and int(o) <= 255
+        for o in octets)
+
+
+def _get_sheet(wb, name: str):
+    """Return a required worksheet; in read-only mode it is parsed lazily on iteration."""
+    if name not in wb.sheetnames:
+        raise Exception(f"{name} sheet missing")
+    ws = wb[name]
+    # read-only mode trusts the stored <dimension>, which non-Excel writers often leave
+    # stale (e.g. "A1") and which would truncate every row; read the actual cells instead
+    ws.reset_dimensions()
+    return ws
 
 
 def _parse_static_routes(routes_str: Optional[str]) -> Dict[str, Dict[str, str]]:
@@ -83,24 +263,15 @@ def _parse_static_routes(routes_str: Optional[str]) -> Dict[str, Dict[str, str]]
         if not routes_str:
             return result
 
-        pairs = routes_str.split()
-        for pair in pairs:
-            pair = pair.strip()
-            if not pair or '@' not in pair:
-                continue
-
-            parts = pair.split('@', 1)
-            if len(parts) != 2:
-                continue
-
-            route = parts[0].strip()
-            nexthop = parts[1].strip()
-
-            if not route or not nexthop:
+        for pair in routes_str.split():
+            match = _ROUTE_RE.fullmatch(pair)
+            if not match:
                 continue
+            route, nexthop = match.groups()
 
             # Validate it's a valid network (this will raise if invalid)
-            ipaddress.ip_network(route, strict=False)
+            if not _is_v4_cidr(route):
+                _ip_network(route)
 
             # Store in result
             result[route] = {"via": nexthop}
@@ -112,14 +283,12 @@ def _parse_static_routes(routes_str: Optional[str]) -> Dict[str, Dict[str, str]]
 
 
 def _parse_fabric(wb) -> Dict[str, Any]:
-    if "FABRIC" not in wb.sheetnames:
-        raise Exception("FABRIC sheet missing")
-    sh = wb["FABRIC"]
+    sh = _get_sheet(wb, "FABRIC")
     data = {}
     for row in sh.iter_rows(min_row=2, values_only=True):
         if not row or not row[0]: continue
         key = str(row[0]).strip()
-        val = row[1]
+        val = _cell(row, 1)  # rows are not padded once dimensions are reset
         data[key] = val
     # normalize
     data.setdefault("topologyname", data.get("topology_name"))
@@ -135,7 +304,7 @@ def _parse_fabric(wb) -> Dict[str, Any]:
     return data
 
 
-def _parse_interfaces(wb) -> List[Dict[str, Any]]:
+def _parse_interfaces(wb) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
     """
     Parse INTERFACES sheet with speed and channelization support
 
@@ -144,72 +313,54 @@ def _parse_interfaces(wb) -> List[Dict[str, Any]]:
     SPEED: 10G, 25G, 50G, 100G, 200G, AUTO (case-insensitive)
     CHANNELIZED: TRUE/FALSE (boolean)
 
-    Returns list of interface connection dicts
+    Returns (list of interface connection dicts, {device: role}); roles are collected
+    in the same pass and conflicting roles for one device raise
     """
-    if "INTERFACES" not in wb.sheetnames:
-        raise Exception("INTERFACES sheet missing")
-    sh = wb["INTERFACES"]
-
-    # Get headers from row 1
-    header_row = next(sh.iter_rows(min_row=1, max_row=1, values_only=True))
-    headers = [str(h).strip().upper() if h else "" for h in header_row]
-
-    # Find column indices
-    def find_col(name):
-        try:
-            return headers.index(name)
-        except ValueError:
-            return None
-
-    src_dev_idx = find_col("SRC_DEVICE")
-    src_role_idx = find_col("SRC_DEVICE_ROLE")
-    src_int_idx = find_col("SRC_INT")
-    dst_dev_idx = find_col("DST_DEVICE")
-    dst_role_idx = find_col("DST_DEVICE_ROLE")
-    dst_int_idx = find_col("DST_INT")
-    ae_idx_idx = find_col("AE_IDX")
-    speed_idx = find_col("SPEED")
-    channelized_idx = find_col("CHANNELIZED")
+    sh = _get_sheet(wb, "INTERFACES")
+
+    # Single streaming pass: headers from row 1, data rows follow
+    rows = sh.iter_rows(values_only=True)
+    col = _header_index(next(rows, ()), upper=True)
+
+    src_dev_idx = col.get("SRC_DEVICE")
+    src_role_idx = col.get("SRC_DEVICE_ROLE")
+    src_int_idx = col.get("SRC_INT")
+    dst_dev_idx = col.get("DST_DEVICE")
+    dst_role_idx = col.get("DST_DEVICE_ROLE")
+    dst_int_idx = col.get("DST_INT")
+    ae_idx_idx = col.get("AE_IDX")
+    speed_idx = col.get("SPEED")
+    channelized_idx = col.get("CHANNELIZED")
 
     if src_dev_idx is None or src_int_idx is None or dst_dev_idx is None or dst_int_idx is None:
         raise Exception("INTERFACES sheet missing required columns (SRC_DEVICE, SRC_INT, DST_DEVICE, DST_INT)")
 
+    text_cols = (src_dev_idx, src_role_idx, src_int_idx, dst_dev_idx, dst_role_idx, dst_int_idx)
+
     out = []
-    for row in sh.iter_rows(min_row=2, values_only=True):
-        if not row or not row[src_dev_idx]:
+    roles: Dict[str, str] = {}
+    for row in rows:
+        if not row or not _cell(row, src_dev_idx):
             continue
 
         # Parse basic interface data
-        src_dev = str(row[src_dev_idx]).strip() if row[src_dev_idx] else None
-        src_role = str(row[src_role_idx]).strip() if src_role_idx is not None and len(row) > src_role_idx and row[
-            src_role_idx] else None
-        src_int = str(row[src_int_idx]).strip() if row[src_int_idx] else None
-        dst_dev = str(row[dst_dev_idx]).strip() if row[dst_dev_idx] else None
-        dst_role = str(row[dst_role_idx]).strip() if dst_role_idx is not None and len(row) > dst_role_idx and row[
-            dst_role_idx] else None
-        dst_int = str(row[dst_int_idx]).strip() if row[dst_int_idx] else None
-        ae_idx = _i(row[ae_idx_idx]) if ae_idx_idx is not None and len(row) > ae_idx_idx and row[ae_idx_idx] else None
+        src_dev, src_role, src_int, dst_dev, dst_role, dst_int = [_s(_cell(row, c)) for c in text_cols]
+        ae_raw = _cell(row, ae_idx_idx)
+        ae_idx = _i(ae_raw) if ae_raw else None
 
         # Parse speed (optional)
-        speed = None
-        if speed_idx is not None and len(row) > speed_idx and row[speed_idx]:
-            speed_raw = str(row[speed_idx]).strip().upper()
-            # Normalize speed format: 10G, 25G, 50G, 100G, 200G, AUTO
-            if speed_raw in ["10G", "25G", "50G", "100G", "200G", "AUTO"]:
-                speed = speed_raw.lower()  # Mist API uses lowercase
-            else:
-                # Try to extract just the number+G part
-                import re
-                match = re.match(r'(\d+)G?', speed_raw, re.IGNORECASE)
-                if match:
-                    speed = f"{match.group(1)}g"
-                elif speed_raw == "AUTO":
-                    speed = "auto"
+        speed_raw = _cell(row, speed_idx)
+        speed = _speed(speed_raw) if speed_raw else None
 
         # Parse channelized (optional)
-        channelized = None
-        if channelized_idx is not None and len(row) > channelized_idx and row[channelized_idx]:
-            channelized = _b(row[channelized_idx])
+        channelized_raw = _cell(row, channelized_idx)
+        channelized = _b(channelized_raw) if channelized_raw else None
+
+        for dev, role in ((src_dev, src_role), (dst_dev, dst_role)):
+            if not dev or not role: continue
+            if dev in roles and roles[dev] != role:
+                raise Exception(f"Device '{dev}' has conflicting roles: '{roles[dev]}' vs '{role}'")
+            roles[dev] = role
 
         out.append({
             "src_device": src_dev,
@@ -225,18 +376,7 @@ def _parse_interfaces(wb) -> List[Dict[str, Any]]:
 
     if not out:
         raise Exception("INTERFACES has no rows")
-    return out
-
-
-def _roles_from_interfaces(entries: List[Dict[str, Any]]) -> Dict[str, str]:
-    roles: Dict[str, str] = {}
-    for e in entries:
-        for dev, role in ((e["src_device"], e["src_role"]), (e["dst_device"], e["dst_role"])):
-            if not dev or not role: continue
-            if dev in roles and roles[dev] != role:
-                raise Exception(f"Device '{dev}' has conflicting roles: '{roles[dev]}' vs '{role}'")
-            roles[dev] = role
-    return roles
+    return out, roles
 
 
 def _parse_network_comment_directives(comment: Optional[str]) -> Tuple[
@@ -244,78 +384,99 @@ def _parse_network_comment_directives(comment: Optional[str]) -> Tuple[
     r4: Dict[str, Dict[str, str]] = {}
     r6: Dict[str, Dict[str, str]] = {}
     if not comment: return r4, r6
+    comment = str(comment)
+    # most comments are plain text without a routing directive
+    if " via " not in comment: return r4, r6
     try:
-        parts = [p.strip() for p in str(comment).split(";") if p.strip()]
+        parts = [p.strip() for p in comment.split(";") if p.strip()]
         for p in parts:
             if " via " in p:
                 prefix, nh = [x.strip() for x in p.split(" via ", 1)]
                 if prefix.lower().startswith("default"): prefix = "0.0.0.0/0"
                 if ":" in prefix:
-                    ipaddress.ip_network(prefix, strict=False)
+                    _ip_network(prefix)
                     r6[prefix] = {"via": nh}
                 else:
-                    ipaddress.ip_network(prefix, strict=False)
+                    _ip_network(prefix)
                     r4[prefix] = {"via": nh}
     except Exception:
         pass
     return r4, r6
 
 
-def _parse_networks(wb) -> Tuple[Dict[str, Any], Dict[str, Any], List[str], List[Dict[str, Any]]]:
-    if "NETWORKS" not in wb.sheetnames:
-        raise Exception("NETWORKS sheet missing")
-    sh = wb["NETWORKS"]
-    header = [str(c).strip() if c else "" for c in next(sh.iter_rows(min_row=1, max_row=1, values_only=True))]
-    rows = []
-    for row in sh.iter_rows(min_row=2, values_only=True):
-        if not row or row[0] is None: continue
-        rows.append({header[i]: row[i] for i in range(min(len(header), len(row)))})
+def _check_core_ip_range(name: str, gw: Any) -> None:
+    """
+    The two collapsed cores get gateway+1 and gateway+2 (see make_other_ip_configs).
+    Fail early if those addresses fall outside the usable range of the subnet.
+    """
+    net = gw.network
+    last = int(net.broadcast_address)
+    if net.version == 4 and net.prefixlen < 31:
+        last -= 1  # broadcast is not a usable host address
+    if int(gw.ip) + 2 > last:
+        raise Exception(f"Network '{name}': gateway {gw} leaves no room for core addresses +1/+2 in {net}")
+
+
+def _parse_networks(wb) -> Tuple[Dict[str, Any], Dict[str, Any], List[str], List[NetworkGateways]]:
+    sh = _get_sheet(wb, "NETWORKS")
+    sheet_rows = sh.iter_rows(values_only=True)
+    col = _header_index(next(sheet_rows, ()))
+    name_i, vlan_i, vrf_i = col.get("NETWORKNAME"), col.get("VLAN_ID"), col.get("VRF")
+    gw4_i, gw6_i = col.get("GATEWAY"), col.get("GATEWAY6")
+    routes_v4_i, routes_v6_i = col.get("STATIC_ROUTESv4"), col.get("STATIC_ROUTESv6")
+    comment_i = col.get("COMMENT")
+
+    rows: List[NetworkGateways] = []
     site_networks: Dict[str, Any] = {}
     vrf_instances: Dict[str, Any] = {}
-    network_name_list: List[str] = []
     extra_v4: Dict[str, Dict[str, Dict[str, str]]] = {}
     extra_v6: Dict[str, Dict[str, Dict[str, str]]] = {}
-    for net in rows:
-        name = str(net.get("NETWORKNAME") or "").strip()
+    for row in sheet_rows:
+        if not row or row[0] is None: continue
+        name = str(_cell(row, name_i) or "").strip()
         if not name: continue
-        network_name_list.append(name)
-        vlan_raw = net.get("VLAN_ID")
+        vlan_raw = _cell(row, vlan_i)
         vlan_id = _i(vlan_raw, default=vlan_raw)
         try:
             vlan_id = int(vlan_id)
         except Exception:
             pass  # keep as-is if text
 
-        vrf = str(net.get("VRF") or "").strip()
-        gw4 = net.get("GATEWAY")
-        gw6 = net.get("GATEWAY6")
+        vrf = str(_cell(row, vrf_i) or "").strip()
+        gw4 = _cell(row, gw4_i)
+        gw6 = _cell(row, gw6_i)
 
         # NEW: Parse STATIC_ROUTESv4 and STATIC_ROUTESv6
-        static_routes_v4_str = net.get("STATIC_ROUTESv4")
-        static_routes_v6_str = net.get("STATIC_ROUTESv6")
+        static_routes_v4_str = _cell(row, routes_v4_i)
+        static_routes_v6_str = _cell(row, routes_v6_i)
 
-        comment = net.get("COMMENT")
+        comment = _cell(row, comment_i)
 
         subnet4 = ""
         subnet6 = ""
         gw4_ip = ""
         gw6_ip = ""
+        i4 = i6 = None
         if gw4:
-            i4 = ipaddress.ip_interface(str(gw4))
+            i4 = _ip_interface(str(gw4))
             subnet4 = f"{i4.network.network_address}/{i4.network.prefixlen}"
             gw4_ip = str(i4.ip)
+            _check_core_ip_range(name, i4)
         if gw6:
-            i6 = ipaddress.ip_interface(str(gw6))
+            i6 = _ip_interface(str(gw6))
             subnet6 = f"{i6.network.network_address}/{i6.network.prefixlen}"
             gw6_ip = str(i6.ip)
+            _check_core_ip_range(name, i6)
+        rows.append(NetworkGateways(name, i4, i6))
 
-        site_networks[name] = {
+        network = {
             "vlan_id": vlan_id,
             "subnet": subnet4,
             "subnet6": subnet6,
         }
-        if gw4_ip: site_networks[name]["gateway"] = gw4_ip
-        if gw6_ip: site_networks[name]["gateway6"] = gw6_ip
+        if gw4_ip: network["gateway"] = gw4_ip
+        if gw6_ip: network["gateway6"] = gw6_ip
+        site_networks[name] = network
 
         if vrf:
             inst = vrf_instances.setdefault(vrf, {"networks": [], "v4_routing": False, "v6_routing": False})
@@ -342,9 +503,28 @@ def _parse_networks(wb) -> Tuple[Dict[str, Any], Dict[str, Any], List[str], List
     for vrf, inst in vrf_instances.items():
         if vrf in extra_v4: inst["extra_routes"] = extra_v4[vrf]
         if vrf in extra_v6: inst["extra_routes6"] = extra_v6[vrf]
+    # names in sheet order (first occurrence); built in one go from the keyed networks
+    network_name_list = list(site_networks)
     return site_networks, vrf_instances, network_name_list, rows
 
 
+def _prep_network_ip_meta(networks_rows: List[NetworkGateways]) -> List[Dict[str, Any]]:
+    """
+    Prepare the NETWORKS gateways (parsed in _parse_networks) for make_other_ip_configs.
+    Addresses are kept as integers so each core offset is plain integer arithmetic.
+    """
+    meta = []
+    for name, i4, i6 in networks_rows:
+        meta.append({
+            "name": name,
+            "base_v4": int(i4.ip) if i4 else None,
+            "netmask": str(i4.network.netmask) if i4 else None,
+            "base_v6": int(i6.ip) if i6 else None,
+            "prefix6": i6.network.prefixlen if i6 else None,
+        })
+    return meta
+
+
 def _find_existing_topology(mist: mistClient.Mist, site_id: str, topology_name: str) -> Optional[Dict[str, Any]]:
     """
     Search for an existing EVPN topology by name in the specified site
@@ -365,24 +545,9 @@ def _find_existing_topology(mist: mistClient.Mist, site_id: str, topology_name:
         return None
 
 
-def _get_device_config(mist: mistClient.Mist, site_id: str, device_id: str) -> Dict[str, Any]:
-    """
-    Fetch current device configuration from Mist API
-    Returns the complete device configuration dict
-    """
-    try:
-        url = f"sites/{site_id}/devices/{device_id}"
-        device = mist.get(url)
-        return device if device else {}
-    except Exception as e:
-        print(f"Warning: Failed to retrieve device config for {device_id}: {e}")
-        return {}
-
-
 def _merge_port_configs(
         current_port_config: Dict[str, Any],
-        new_evpn_ports: Dict[str, Any],
-        esi_lag_name: str
+        new_evpn_ports: Dict[str, Any]
 ) -> Dict[str, Any]:
     """
     Intelligently merge port configurations, preserving user-configured ports.
@@ -397,22 +562,33 @@ def _merge_port_configs(
     Args:
         current_port_config: Current port config from device (CACHED from before topology update)
         new_evpn_ports: New EVPN uplink/downlink/ESI-LAG ports from Excel
-        esi_lag_name: Name of ESI-LAG port usage (e.g., "EVPN-ESI-LAG")
 
     Returns:
         Merged port configuration
     """
-    merged_config = {}
-
-    # Start with current config (preserves all existing user-configured ports)
-    for port_name, port_cfg in current_port_config.items():
-        merged_config[port_name] = port_cfg
+    # Start with current config (preserves all existing user-configured ports),
+    # then overlay the new EVPN ports (these take precedence)
+    merged_config = dict(current_port_config)
+    merged_config.update(new_evpn_ports)
+    return merged_config
 
-    # Update with new EVPN ports (these take precedence)
-    for port_name, port_cfg in new_evpn_ports.items():
-        merged_config[port_name] = port_cfg
 
-    return merged_config
+def _merge_optic(optic_config: Dict[str, Dict[str, Any]], dev: Optional[str], port: Optional[str],
+                 speed: Optional[str], channelized: Optional[bool]) -> None:
+    """Add speed/channelized for the base port of dev:port to optic_config (first occurrence wins)"""
+    if not dev or not port:
+        return
+    base_port = _base_port(port)
+    slot = optic_config.setdefault(dev, {})
+    if base_port in slot:
+        return
+    config_entry = {}
+    if speed is not None:
+        config_entry["speed"] = speed
+    if channelized is not None:
+        config_entry["channelized"] = channelized
+    if config_entry:  # Only add if we have something to configure
+        slot[base_port] = config_entry
 
 
 def _build_optic_port_config(entries: List[Dict[str, Any]], device_roles: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
@@ -445,88 +621,41 @@ def _build_optic_port_config(entries: List[Dict[str, Any]], device_roles: Dict[s
         if speed is None and channelized is None:
             continue
 
-        # Extract base port name (remove :0, :1, :2, :3 suffix for channelized ports)
-        def get_base_port(port_name: str) -> str:
-            """Extract base port name, removing channelization suffix (:0, :1, etc.)"""
-            if not port_name:
-                return port_name
-            # Remove channelization suffix like :0, :1, :2, :3
-            import re
-            match = re.match(r'^([^:]+)(?::\d+)?$', port_name)
-            if match:
-                return match.group(1)
-            return port_name
-
-        # Process source device/interface
-        if e.get("src_device") and e.get("src_int"):
-            src_dev = e["src_device"]
-            src_base_port = get_base_port(e["src_int"])
-
-            if src_dev not in optic_config:
-                optic_config[src_dev] = {}
-
-            # Only add if not already configured (first occurrence wins)
-            if src_base_port not in optic_config[src_dev]:
-                config_entry = {}
-                if speed is not None:
-                    config_entry["speed"] = speed
-                if channelized is not None:
-                    config_entry["channelized"] = channelized
-
-                if config_entry:  # Only add if we have something to configure
-                    optic_config[src_dev][src_base_port] = config_entry
-
-        # Process destination device/interface
-        if e.get("dst_device") and e.get("dst_int"):
-            dst_dev = e["dst_device"]
-            dst_base_port = get_base_port(e["dst_int"])
-
-            if dst_dev not in optic_config:
-                optic_config[dst_dev] = {}
-
-            # Only add if not already configured (first occurrence wins)
-            if dst_base_port not in optic_config[dst_dev]:
-                config_entry = {}
-                if speed is not None:
-                    config_entry["speed"] = speed
-                if channelized is not None:
-                    config_entry["channelized"] = channelized
-
-                if config_entry:  # Only add if we have something to configure
-                    optic_config[dst_dev][dst_base_port] = config_entry
+        # Process source and destination device/interface
+        _merge_optic(optic_config, e.get("src_device"), e.get("src_int"), speed, channelized)
+        _merge_optic(optic_config, e.get("dst_device"), e.get("dst_int"), speed, channelized)
 
     return optic_config
 
 
 def _build_topology(entries: List[Dict[str, Any]], device_roles: Dict[str, str]) -> Tuple[
-    List[Dict[str, str]], Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    List[Tuple[str, str, str, str]], Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]]]:
     core_devices = [d for d, r in device_roles.items() if r == "collapsed-core"]
     if len(core_devices) < 2:
         raise Exception("Need at least two devices with role 'collapsed-core'")
     # stable order
     core_devices.sort()
-    # core-core links
-    core_links: List[Dict[str, str]] = []
+    # one pass over the entries: core-core links and core<->access AE members
+    # (core1, core2, port1, port2): tuple order is the link numbering sort order
+    core_links: List[Tuple[str, str, str, str]] = []
     seen = set()
+    ae_groups: Dict[int, List[Dict[str, Any]]] = {}
     for e in entries:
-        if e["src_device"] in core_devices and e["dst_device"] in core_devices:
-            a = (e["src_device"], e["src_int"])
-            b = (e["dst_device"], e["dst_int"])
-            key = frozenset({a, b})
+        s_is_core = device_roles.get(e["src_device"]) == "collapsed-core"
+        d_is_core = device_roles.get(e["dst_device"]) == "collapsed-core"
+        if s_is_core and d_is_core:
+            # direction-independent key; "" keeps tuples comparable if an interface cell is empty
+            a = (e["src_device"], e["src_int"] or "")
+            b = (e["dst_device"], e["dst_int"] or "")
+            key = (a, b) if a <= b else (b, a)
             if key in seen: continue
             seen.add(key)
-            core_links.append(
-                {"core1": e["src_device"], "port1": e["src_int"], "core2": e["dst_device"], "port2": e["dst_int"]})
+            core_links.append((e["src_device"], e["dst_device"], e["src_int"], e["dst_int"]))
+        elif (s_is_core or d_is_core) and e["ae_idx"] is not None:
+            ae_groups.setdefault(e["ae_idx"], []).append(e)
 
     access_port_config: Dict[str, Dict[str, Any]] = {}
     core_port_config: Dict[str, Dict[str, Any]] = {c: {} for c in core_devices}
-    ae_groups: Dict[int, List[Dict[str, Any]]] = {}
-    for e in entries:
-        if e["ae_idx"] is None: continue
-        s_is_core = device_roles.get(e["src_device"]) == "collapsed-core"
-        d_is_core = device_roles.get(e["dst_device"]) == "collapsed-core"
-        if s_is_core ^ d_is_core:
-            ae_groups.setdefault(e["ae_idx"], []).append(e)
 
     for ae, conns in ae_groups.items():
         if len(conns) != 2:
@@ -548,43 +677,70 @@ def _build_topology(entries: List[Dict[str, Any]], device_roles: Dict[str, str])
         port_key = ",".join(sorted({p for p in access_ports if p}))
         access_port_config[access_dev] = {port_key: {"usage": "EVPN-ESI-LAG", "aggregated": True, "ae_idx": ae}}
 
-    for i, l in enumerate(sorted(core_links, key=lambda x: (x["core1"], x["core2"], x["port1"], x["port2"])), start=1):
-        c1, p1, c2, p2 = l["core1"], l["port1"], l["core2"], l["port2"]
-        if i % 2 == 1:
-            core_port_config[c1][p1] = {"usage": "evpn_downlink", "link_name": f"link{i}"}
-            core_port_config[c2][p2] = {"usage": "evpn_uplink", "link_name": f"link{i}"}
-        else:
-            core_port_config[c1][p1] = {"usage": "evpn_uplink", "link_name": f"link{i}"}
-            core_port_config[c2][p2] = {"usage": "evpn_downlink", "link_name": f"link{i}"}
+    # odd links: core1 downlink / core2 uplink, even links: the other way round
+    link_usages = (("evpn_downlink", "evpn_uplink"), ("evpn_uplink", "evpn_downlink"))
+    core_links.sort()
+    for i, (c1, c2, p1, p2) in enumerate(core_links, start=1):
+        usage1, usage2 = link_usages[(i - 1) & 1]
+        link_name = f"link{i}"
+        core_port_config[c1][p1] = {"usage": usage1, "link_name": link_name}
+        core_port_config[c2][p2] = {"usage": usage2, "link_name": link_name}
     return core_links, core_port_config, access_port_config
 
 
+def _push_device(mist: mistClient.Mist, url: str, name: str,
+                 payload: Dict[str, Any]) -> Tuple[str, Optional[Exception]]:
+    """
+    PUT one device configuration (runs in the step-3 thread pool)
+    Returns (name, None) on success or (name, exception) on failure
+    """
+    try:
+        mist.put(url, payload, parse_response=False)
+        return name, None
+    except Exception as e:
+        return name, e
+
+
 def create_fabric(xlsx_path: str):
-    print("Connecting to Mist API...")
-    mist = mistClient.Mist(MIST_API_URL, MIST_TOKEN, MIST_ORGID)
-    mh = mistHelpers.MistHelpers(mist)
-    if not mist.test_connection():
-        raise Exception("Failed to connect to Mist API")
-    print("Successfully connected to API.\n")
+    from openpyxl import load_workbook
+    import mistClient
+    import mistHelpers
+
+    _check_required_sheets(xlsx_path)
 
-    wb = load_workbook(xlsx_path)
+    # parse excel
+    # read-only: rows are streamed from the sheet XML, so every sheet is read exactly
+    # once up front and the file handle is released before talking to the API
+    wb = load_workbook(xlsx_path, read_only=True, data_only=True, keep_links=False)
+    try:
+        fabric = _parse_fabric(wb)
+        entries, roles = _parse_interfaces(wb)
+        site_networks, vrf_instances, network_name_list, networks_rows = _parse_networks(wb)
+    finally:
+        wb.close()
 
-    fabric = _parse_fabric(wb)
     site_name = fabric.get("site_name") or fabric.get("topologyname")
     topo_name = fabric.get("topologyname")
     if not site_name or not topo_name:
         raise Exception("FABRIC needs 'site_name' and 'topologyname'")
 
+    print("Connecting to Mist API...")
+    mist = mistClient.Mist(MIST_API_URL, MIST_TOKEN, MIST_ORGID, pool_maxsize=MIST_MAX_WORKERS)
+    mh = mistHelpers.MistHelpers(mist)
+    if not mist.test_connection():
+        raise Exception("Failed to connect to Mist API")
+    print("Successfully connected to API.\n")
+
     # Lookup site id
-    site_id = None
-    for s in mh.get_sites():
-        if s.get("name") == site_name:
-            site_id = s.get("id")
-            break
+    site = mh.get_site_by_name(site_name)
+    site_id = site.get("id") if site else None
     if not site_id:
         raise Exception(f"Site '{site_name}' not found")
 
     print(f"Found site: {site_name} (ID: {site_id})")
+    # site-scoped endpoints used by the setting and per-device PUTs
+    setting_url = f"sites/{site_id}/setting"
+    dev_url_prefix = f"sites/{site_id}/devices/"
 
     # =========================================================================
     # CHECK FOR EXISTING TOPOLOGY
@@ -603,13 +759,10 @@ def create_fabric(xlsx_path: str):
         mode = "CREATE"
         topo_id = None
 
-    # devices in site
+    # devices in site (single inventory fetch; all hostname lookups go through dev_by_name)
     devs = mh.get_switches(site_id)
     dev_by_name = {d.get("name"): d for d in devs}
 
-    # parse excel
-    entries = _parse_interfaces(wb)
-    roles = _roles_from_interfaces(entries)
     core_devices = sorted([d for d, r in roles.items() if r == "collapsed-core"])
     if len(core_devices) < 2:
         raise Exception("Need two collapsed-core devices in INTERFACES")
@@ -619,8 +772,6 @@ def create_fabric(xlsx_path: str):
         if name not in dev_by_name:
             raise Exception(f"Device '{name}' not found in site '{site_name}'")
 
-    site_networks, vrf_instances, network_name_list, networks_rows = _parse_networks(wb)
-
     # build port configs
     core_links, core_port_config, access_port_config = _build_topology(entries, roles)
 
@@ -635,12 +786,13 @@ def create_fabric(xlsx_path: str):
     # =========================================================================
     # Cache device configs BEFORE updating topology
     # This preserves user-configured ports during updates
+    # The site device list fetched above already holds the full device configs,
+    # so no per-device GET is needed
     device_configs_cache = {}
     if mode == "UPDATE":
         print(f"\n=== Caching current device configurations ===")
         for name in roles.keys():
-            dev_id = dev_by_name[name].get("id")
-            device_configs_cache[name] = _get_device_config(mist, site_id, dev_id)
+            device_configs_cache[name] = dev_by_name[name]
             print(f"Cached config for: {name}")
         print("Device configs cached successfully")
 
@@ -651,30 +803,14 @@ def create_fabric(xlsx_path: str):
     print(f"  - Networks: {len(site_networks)}")
     print(f"  - Port usage: {fabric['esi_lag_name']}")
 
+    # built once; step 4 re-sends it with the topology id added
+    esi_lag_usage = {**_ESI_LAG_USAGE_TEMPLATE, "storm_control": {}, "networks": network_name_list}
     site_setting_payload = {
         "vrf_instances": vrf_instances,
         "networks": site_networks,
-        "port_usages": {
-            fabric["esi_lag_name"]: {
-                "mode": "trunk",
-                "disabled": False,
-                "port_network": None,
-                "voip_network": None,
-                "stp_edge": False,
-                "all_networks": False,
-                "networks": network_name_list,
-                "port_auth": None,
-                "speed": "auto",
-                "duplex": "auto",
-                "mac_limit": "0",
-                "poe_disabled": True,
-                "enable_qos": False,
-                "storm_control": {},
-                "mtu": "9200"
-            }
-        }
+        "port_usages": {fabric["esi_lag_name"]: esi_lag_usage}
     }
-    resp = mist.put(f"sites/{site_id}/setting", site_setting_payload)
+    mist.put(setting_url, site_setting_payload, parse_response=False)
     print("Site settings updated successfully")
 
     # 2) Create or Update EVPN topology
@@ -700,17 +836,17 @@ def create_fabric(xlsx_path: str):
 
     switches = []
     # stable core order; first two are the cores that get +1/+2
+    # each core links to the first other core in that order
+    core_mac = {c: _mac(dev_by_name[c].get("mac")) for c in core_devices}
+    core_peer = {c: core_devices[1] if c == core_devices[0] else core_devices[0] for c in core_devices}
     for name, role in roles.items():
         d = dev_by_name[name]
-        mac = (d.get("mac") or "").replace(":", "").replace("-", "").replace(".", "").lower()
+        mac = core_mac[name] if role == "collapsed-core" else _mac(d.get("mac"))
         e = {"mac": mac, "role": role, "uplinks": [], "downlinks": [], "config": {"port_config": {}}}
         if role == "collapsed-core":
             # link to the other core
-            other = [c for c in core_devices if c != name]
-            if other:
-                omac = (dev_by_name[other[0]].get("mac") or "").replace(":", "").replace("-", "").replace(".",
-                                                                                                          "").lower()
-                if omac: e["uplinks"] = [omac]; e["downlinks"] = [omac]
+            omac = core_mac[core_peer[name]]
+            if omac: e["uplinks"] = [omac]; e["downlinks"] = [omac]
             e["config"]["port_config"] = core_port_config.get(name, {})
         else:
             e["config"]["port_config"] = access_port_config.get(name, {})
@@ -722,7 +858,7 @@ def create_fabric(xlsx_path: str):
     if mode == "UPDATE":
         # Use PUT to update existing topology
         print(f"Updating existing topology '{topo_name}' (ID: {topo_id}) with {len(switches)} switches")
-        topo_resp = mist.put(f"sites/{site_id}/evpn_topologies/{topo_id}", topo_payload)
+        mist.put(f"sites/{site_id}/evpn_topologies/{topo_id}", topo_payload, parse_response=False)
         print(f"EVPN topology updated successfully")
     else:
         # Use POST to create new topology
@@ -736,88 +872,84 @@ def create_fabric(xlsx_path: str):
     # offsets: +1 for first core, +2 for second core (sorted list)
     core_offsets = {core_devices[0]: 1, core_devices[1]: 2}
 
+    network_ip_meta = _prep_network_ip_meta(networks_rows)
+
     def make_other_ip_configs(offset: int) -> Dict[str, Any]:
         cfg = {}
-        for net in networks_rows:
-            name = str(net.get("NETWORKNAME") or "").strip()
-            if not name: continue
+        for meta in network_ip_meta:
             entry = {}
-            gw4 = net.get("GATEWAY")
-            gw6 = net.get("GATEWAY6")
-            if gw4:
-                i4 = ipaddress.ip_interface(str(gw4))
-                ip4 = i4.ip + offset
-                entry.update({"type": "static", "ip": str(ip4), "netmask": str(i4.network.netmask)})
-            if gw6:
-                i6 = ipaddress.ip_interface(str(gw6))
-                ip6 = i6.ip + offset
-                entry.update({"type6": "static", "ip6": str(ip6), "netmask6": f"/{i6.network.prefixlen}"})
+            if meta["base_v4"] is not None:
+                ip4 = ipaddress.IPv4Address(meta["base_v4"] + offset)
+                entry.update({"type": "static", "ip": str(ip4), "netmask": meta["netmask"]})
+            if meta["base_v6"] is not None:
+                ip6 = ipaddress.IPv6Address(meta["base_v6"] + offset)
+                entry.update({"type6": "static", "ip6": str(ip6), "netmask6": f"/{meta['prefix6']}"})
             if entry:
-                cfg[name] = entry
+                cfg[meta["name"]] = entry
         return cfg
 
-    for name, role in roles.items():
-        dev_id = dev_by_name[name].get("id")
-
-        # Get the new EVPN port config from Excel
-        new_port_config = core_port_config.get(name, {}) if role == "collapsed-core" else access_port_config.get(name,
-                                                                                                                 {})
+    def iter_device_payloads() -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+        """Yield (name, device_id, payload) per switch; payloads are built one at a time as they are sent"""
+        for name, role in roles.items():
+            dev_id = dev_by_name[name].get("id")
 
-        # In UPDATE mode, merge with cached config to preserve user-configured ports
-        if mode == "UPDATE":
-            cached_config = device_configs_cache.get(name, {})
-            current_port_config = cached_config.get("port_config", {})
-            final_port_config = _merge_port_configs(current_port_config, new_port_config, fabric["esi_lag_name"])
-        else:
-            final_port_config = new_port_config
+            # Get the new EVPN port config from Excel
+            new_port_config = (core_port_config if role == "collapsed-core" else access_port_config).get(name, {})
 
-        if role == "collapsed-core":
-            offset = core_offsets.get(name, 1)  # default first core
-            payload = {
-                "other_ip_configs": make_other_ip_configs(offset),
-                "port_config": final_port_config,
-                "optic_port_config": optic_port_config.get(name, {}),
-                "vrf_config": {"enabled": bool(vrf_instances)},
-                "dhcpd_config": {"enabled": False}
-            }
-            print(f"Configuring collapsed-core switch: {name}")
-        else:
-            payload = {
-                "other_ip_configs": {},
-                "port_config": final_port_config,
-                "optic_port_config": optic_port_config.get(name, {}),
-                "-ui_evpntopo_id": True
-            }
-            print(f"Configuring access switch: {name}")
-        resp = mist.put(f"sites/{site_id}/devices/{dev_id}", payload)
+            # In UPDATE mode, merge with cached config to preserve user-configured ports
+            if mode == "UPDATE":
+                cached_config = device_configs_cache.get(name, {})
+                current_port_config = cached_config.get("port_config", {})
+                final_port_config = _merge_port_configs(current_port_config, new_port_config)
+            else:
+                final_port_config = new_port_config
+
+            if role == "collapsed-core":
+                offset = core_offsets.get(name, 1)  # default first core
+                payload = {
+                    "other_ip_configs": make_other_ip_configs(offset),
+                    "port_config": final_port_config,
+                    "optic_port_config": optic_port_config.get(name, {}),
+                    "vrf_config": {"enabled": bool(vrf_instances)},
+                    "dhcpd_config": {"enabled": False}
+                }
+                print(f"Configuring collapsed-core switch: {name}")
+            else:
+                payload = {
+                    "other_ip_configs": {},
+                    "port_config": final_port_config,
+                    "optic_port_config": optic_port_config.get(name, {}),
+                    "-ui_evpntopo_id": True
+                }
+                print(f"Configuring access switch: {name}")
+            yield name, dev_id, payload
+
+    # Device updates are independent of each other, so the PUTs are sent concurrently
+    # while the remaining payloads are still being built
+    # Thread safety: all workers share one mistClient.Mist; this relies on Mist._interact
+    # keeping each reply local (mist.last_reply is last-writer-wins and is not read here)
+    with ThreadPoolExecutor(max_workers=max(1, min(MIST_MAX_WORKERS, len(roles)))) as pool:
+        device_puts = [pool.submit(_push_device, mist, dev_url_prefix + dev_id, name, payload)
+                       for name, dev_id, payload in iter_device_payloads()]
+
+    # report in device order; one failed device does not stop the others
+    failed = []
+    for f in device_puts:
+        name, error = f.result()
+        if error is not None:
+            print(f"Failed to configure {name}: {error}")
+            failed.append(name)
+    if failed:
+        raise Exception(f"Device configuration failed for: {', '.join(failed)}")
 
     # 4) Link EVPN topology to port usage (include networks again to be safe)
     print("\n=== STEP 4: Linking EVPN-ESI-LAG to topology ===")
     final_payload = {
-        "port_usages": {
-            fabric["esi_lag_name"]: {
-                "mode": "trunk",
-                "disabled": False,
-                "port_network": None,
-                "voip_network": None,
-                "stp_edge": False,
-                "all_networks": False,
-                "port_auth": None,
-                "speed": "auto",
-                "duplex": "auto",
-                "mac_limit": "0",
-                "poe_disabled": True,
-                "enable_qos": False,
-                "storm_control": {},
-                "mtu": "9200",
-                "networks": network_name_list,
-                "ui_evpntopo_id": topo_id
-            }
-        },
+        "port_usages": {fabric["esi_lag_name"]: dict(esi_lag_usage, ui_evpntopo_id=topo_id)},
         "vrf_instances": vrf_instances,
         "networks": site_networks
     }
-    resp = mist.put(f"sites/{site_id}/setting", final_payload)
+    mist.put(setting_url, final_payload, parse_response=False)
     print("EVPN-ESI-LAG successfully linked to topology")
 
     print("\n=== Fabric creation complete ===")
@@ -829,7 +961,7 @@ def create_fabric(xlsx_path: str):
     print(f"  - Access: {len(roles) - len(core_devices)}")
     print(f"Networks: {len(site_networks)}")
     print(f"VRFs: {len(vrf_instances)}")
-    print(f"ESI-LAG groups: {len(set(e['ae_idx'] for e in entries if e.get('ae_idx')))}")
+    print(f"ESI-LAG groups: {len({ae for e in entries if (ae := e.get('ae_idx'))})}")
     print(f"Core-to-core links: {len(core_links)}")
 
 
@@ -847,7 +979,6 @@ def main():
         create_fabric(xlsx)
     except Exception as e:
         print(f"\nError: {e}")
-        import traceback
         traceback.print_exc()
         sys.exit(1)
 
@@ -2,9 +2,18 @@
 
 import requests
 import json
+import random
+import time
+
+# transient replies worth another attempt; 429 is rate limiting, the rest are gateway/server hiccups
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# methods that are safe to repeat after an unknown outcome (POST would create duplicates)
+IDEMPOTENT_METHODS = ("get", "put", "delete")
 
 class Mist:
-    def __init__(self, api_url, token, org_id, version="v1", ignore_failures=False):
+    def __init__(self, api_url, token, org_id, version="v1", ignore_failures=False, pool_maxsize=10,
+                 max_retries=4, backoff_base=0.5, backoff_max=8.0, retry_after_max=300.0,
+                 timeout=(10, 120)):
         self.token = token
         self.org_id = org_id
         self.headers = {
@@ -14,28 +23,71 @@ class Mist:
         self.base_url = api_url+"/api"
         self.version = version
         self.ignore_failures = ignore_failures
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # sanity cap for a server-sent Retry-After; the header is otherwise honoured as-is
+        self.retry_after_max = retry_after_max
+        # (connect, read) seconds per attempt, so a stalled request fails and can be retried
+        self.timeout = timeout
+        # one session for all calls: keeps the TCP/TLS connection to the API alive
+        self.session = requests.Session()
+        # size the keep-alive pool to the number of concurrent callers so parallel
+        # requests reuse connections instead of opening and discarding extra ones
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
 
 
     def _constructURL(self, url):
         return self.base_url + "/" + self.version + "/" + url.lstrip("/")
 
 
-    def _interact(self, method, url, payload=None):
+    def _retry_delay(self, attempt, reply=None):
+        # honour the server's Retry-After (seconds) when given, else full-jitter exponential backoff
+        if reply is not None:
+            retry_after = reply.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), self.retry_after_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+
+    def _interact(self, method, url, payload=None, parse_response=True):
         if payload:
-            payload = json.dumps(payload)
-        func = getattr(requests, method)
-        self.last_reply = func(self._constructURL(url), data=payload, headers=self.headers)
-        if self.last_reply.status_code in [200, 201, 202]:
-            return self.last_reply.json()
-        elif self.last_reply.status_code == 204:
+            # compact separators: smaller request bodies for the large port/network configs
+            payload = json.dumps(payload, separators=(",", ":"))
+        func = getattr(self.session, method)
+        idempotent = method in IDEMPOTENT_METHODS
+        # the reply stays local: step 3 calls this from several threads at once, and
+        # self.last_reply is only kept for the last_reply() accessor
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                reply = func(self._constructURL(url), data=payload, headers=self.headers, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if last_attempt or not idempotent:
+                    raise
+                time.sleep(self._retry_delay(attempt))
+                continue
+            status = reply.status_code
+            # a 429 was rejected before processing, so even a POST can be repeated
+            if not last_attempt and status in RETRY_STATUS and (idempotent or status == 429):
+                time.sleep(self._retry_delay(attempt, reply))
+                continue
+            break
+        self.last_reply = reply
+        if reply.status_code in [200, 201, 202]:
+            # callers that only need success can skip decoding the echoed object
+            return reply.json() if parse_response else True
+        elif reply.status_code == 204:
             return True
-        elif self.last_reply.status_code in [400, 404, 405, 500, 502, 503]:
+        elif reply.status_code in [400, 404, 405, 500, 502, 503]:
             if self.ignore_failures:
                 return False
             else:
-                raise Exception("HTTP {0}: {1}".format(self.last_reply.status_code, self.last_reply.text))
+                raise Exception("HTTP {0}: {1}".format(reply.status_code, reply.text))
         else:
-            raise Exception("HTTP {0}: {1}".format(self.last_reply.status_code, self.last_reply.text))
+            raise Exception("HTTP {0}: {1}".format(reply.status_code, reply.text))
 
 
     def ignore_failures(self, value):
@@ -55,8 +107,8 @@ class Mist:
         return self._interact("post", url, payload)
 
 
-    def put(self, url, payload=None):
-        return self._interact("put", url, payload)
+    def put(self, url, payload=None, parse_response=True):
+        return self._interact("put", url, payload, parse_response)
 
 
     def delete(self, url, payload=None):
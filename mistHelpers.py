@@ -94,7 +94,7 @@ class MistHelpers:
         return devices
     def get_switches(self, site):
         devices = None
-        devices = self.api.get("sites/{0}/devices?type=switch".format(site))
+        devices = self.api.get("sites/{0}/devices?type=switch&limit=1000".format(site))
         return devices
 
     def get_gateways(self, site):